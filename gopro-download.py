@@ -4,7 +4,8 @@
 import argparse
 import sys
 from pathlib import Path
-from lib.config import setup_logging
+from tqdm.contrib.logging import logging_redirect_tqdm
+from lib.logging import setup_logging
 from lib.download.client import GoProAPIClient, ConfigManager
 from lib.download.downloader import MediaDownloader, MediaProcessor
 from lib.download.constants import Config
@@ -28,6 +29,12 @@ def parse_args() -> argparse.Namespace:
         default=Config.MAX_ITEMS,
         help="Maximum number of items to download"
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=Config.DOWNLOAD_CONCURRENCY,
+        help="Number of media items to process in parallel"
+    )
     parser.add_argument(
         '--download-gpmf',
         action='store_true',
@@ -46,18 +53,21 @@ def main():
     
     config = Config(
         INCLUDE_PHOTOS=args.include_photos,
-        MAX_ITEMS=args.max_items
+        MAX_ITEMS=args.max_items,
+        DOWNLOAD_CONCURRENCY=args.concurrency
     )
     
     try:
         config_manager = ConfigManager()
         creds = config_manager.load_credentials()
         
-        client = GoProAPIClient(creds['access_token'], creds['user_id'], config)
-        downloader = MediaDownloader(client)
-        processor = MediaProcessor(client, downloader, Path(args.output_dir))
-        
-        processor.process_media_items(args.download_gpmf)
+        # Log records are printed above the progress bars
+        with logging_redirect_tqdm(), \
+                GoProAPIClient(creds['access_token'], creds['user_id'], config) as client:
+            downloader = MediaDownloader(client)
+            processor = MediaProcessor(client, downloader, Path(args.output_dir))
+            
+            processor.process_media_items(args.download_gpmf)
         
     except KeyboardInterrupt:
         print("\nOperation cancelled by user", file=sys.stderr)
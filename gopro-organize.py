@@ -4,7 +4,8 @@
 import argparse
 import sys
 from pathlib import Path
-from lib.config import setup_logging
+from tqdm.contrib.logging import logging_redirect_tqdm
+from lib.logging import setup_logging
 from lib.organize.organizer import VideoOrganizer
 
 def parse_args() -> argparse.Namespace:
@@ -29,6 +30,16 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Recursively process subdirectories"
     )
+    parser.add_argument(
+        "--native-only",
+        action="store_true",
+        help="Only set file timestamps, without rewriting embedded metadata (exiftool not required)"
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Pass -fast2 to exiftool; only for files that keep their metadata before the media data"
+    )
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -45,13 +56,15 @@ def main():
             print(f"Error: Directory not found: {args.source_dir}", file=sys.stderr)
             sys.exit(1)
         
-        organizer = VideoOrganizer(
+        # Log records are printed above the progress bar
+        with logging_redirect_tqdm(), VideoOrganizer(
             args.source_dir,
             copy=args.copy,
-            dry_run=args.dry_run
-        )
-        
-        processed, errors = organizer.process_directory(args.recursive)
+            dry_run=args.dry_run,
+            native_only=args.native_only,
+            fast=args.fast
+        ) as organizer:
+            processed, errors = organizer.process_directory(args.recursive)
         
         if args.dry_run:
             print("\nThis was a dry run. No files were modified.")
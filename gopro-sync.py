@@ -3,8 +3,13 @@
 
 import argparse
 import sys
-import subprocess
 from pathlib import Path
+from tqdm.contrib.logging import logging_redirect_tqdm
+from lib.logging import setup_logging
+from lib.download.client import GoProAPIClient, ConfigManager
+from lib.download.downloader import MediaDownloader, MediaProcessor
+from lib.download.constants import Config
+from lib.organize.organizer import VideoOrganizer
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -22,13 +27,30 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         '--max-items',
         type=int,
+        default=Config.MAX_ITEMS,
         help="Maximum number of items to download"
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=Config.DOWNLOAD_CONCURRENCY,
+        help="Number of media items to process in parallel"
+    )
     parser.add_argument(
         '--download-gpmf',
         action='store_true',
         help="Download GPMF data"
     )
+    parser.add_argument(
+        '--native-only',
+        action='store_true',
+        help="Only set file timestamps, without rewriting embedded metadata (exiftool not required)"
+    )
+    parser.add_argument(
+        '--fast',
+        action='store_true',
+        help="Pass -fast2 to exiftool; only for files that keep their metadata before the media data"
+    )
     parser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -38,34 +60,36 @@ def parse_args() -> argparse.Namespace:
 
 def main():
     args = parse_args()
+    setup_logging(args.verbose)
     downloads_dir = Path(args.output_dir) / "downloads"
     
+    config = Config(
+        INCLUDE_PHOTOS=args.include_photos,
+        MAX_ITEMS=args.max_items,
+        DOWNLOAD_CONCURRENCY=args.concurrency
+    )
+    
     try:
         # First download
-        cmd = ["gopro-download", "-o", str(downloads_dir)]
-        if args.include_photos:
-            cmd.append("--include-photos")
-        if args.max_items:
-            cmd.extend(["--max-items", str(args.max_items)])
-        if args.download_gpmf:
-            cmd.append("--download-gpmf")
-        if args.verbose:
-            cmd.append("--verbose")
-            
+        config_manager = ConfigManager()
+        creds = config_manager.load_credentials()
+        downloads_dir.parent.mkdir(parents=True, exist_ok=True)
+        
         print("Downloading media files...")
-        subprocess.run(cmd, check=True)
+        # Log records are printed above the progress bars
+        with logging_redirect_tqdm(), \
+                GoProAPIClient(creds['access_token'], creds['user_id'], config) as client:
+            downloader = MediaDownloader(client)
+            processor = MediaProcessor(client, downloader, downloads_dir)
+            processor.process_media_items(args.download_gpmf)
         
         # Then organize
-        cmd = ["gopro-organize", str(downloads_dir)]
-        if args.verbose:
-            cmd.append("--verbose")
-            
         print("\nOrganizing media files...")
-        subprocess.run(cmd, check=True)
+        with logging_redirect_tqdm(), \
+                VideoOrganizer(downloads_dir, native_only=args.native_only, fast=args.fast) as organizer:
+            processed, errors = organizer.process_directory()
+        print(f"\nProcessing complete. Successfully processed: {processed}, Errors: {errors}")
         
-    except subprocess.CalledProcessError as e:
-        print(f"Error: Command failed with exit code {e.returncode}", file=sys.stderr)
-        sys.exit(1)
     except KeyboardInterrupt:
         print("\nOperation cancelled by user", file=sys.stderr)
         sys.exit(1)
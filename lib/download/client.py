@@ -1,12 +1,18 @@
 import json
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Optional
 from pathlib import Path
+from urllib.parse import urlparse
 from .constants import Config
+from ..jsonutil import loads
 
 logger = logging.getLogger(__name__)
 
+MEDIA_SEARCH_FIELDS = "camera_model,captured_at,file_extension,filename,id,moments_count"
+
 class ConfigManager:
     """Handles loading and saving of credentials"""
     def __init__(self, config_path: str = 'config.json'):
@@ -32,62 +38,90 @@ class ConfigManager:
 
 class GoProAPIClient:
     """Handles all API interactions with GoPro"""
+    _HEADERS = {
+        "Accept": "application/vnd.gopro.jk.media.search+json; version=2.0.0",
+        "Accept-Language": "en-US,en;q=0.9",
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15",
+        "Origin": "https://gopro.com",
+        "Referer": "https://gopro.com/"
+    }
+    _TYPES_NO_PHOTOS = "Burst,BurstVideo,Continuous,LoopedVideo,TimeLapse,TimeLapseVideo,Video"
+    _TYPES_WITH_PHOTOS = _TYPES_NO_PHOTOS + ",Photo"
+    
     def __init__(self, access_token: str, user_id: str, config: Config):
         self.config = config
         self.cookies = {
             "gp_access_token": access_token,
             "gp_user_id": user_id
         }
+        self.session = self._create_session()
     
-    def _get_headers(self) -> Dict[str, str]:
-        return {
-            "Accept": "application/vnd.gopro.jk.media.search+json; version=2.0.0",
-            "Accept-Language": "en-US,en;q=0.9",
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15",
-            "Origin": "https://gopro.com",
-            "Referer": "https://gopro.com/"
-        }
+    def _create_session(self) -> requests.Session:
+        """Create a session that keeps connections to the API alive between calls"""
+        session = requests.Session()
+        # Scope the credentials to the API host so they aren't sent along to media CDNs
+        api_host = urlparse(self.config.BASE_URL).hostname
+        for name, value in self.cookies.items():
+            session.cookies.set(name, value, domain=api_host)
+        session.headers.update(self._HEADERS)
+        
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504]
+        )
+        # Every worker thread, and each range of a split download, needs its own pooled connection
+        pool_size = max(50, self.config.DOWNLOAD_CONCURRENCY * self.config.DOWNLOAD_RANGE_PARTS)
+        session.mount("https://", HTTPAdapter(pool_maxsize=pool_size, max_retries=retries))
+        return session
+    
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def get_media_items(self, page: int = 1) -> Dict:
         """Fetch media items with pagination"""
-        types = "Burst,BurstVideo,Continuous,LoopedVideo,TimeLapse,TimeLapseVideo,Video"
-        if self.config.INCLUDE_PHOTOS:
-            types += ",Photo"
-            
         params = {
             "processing_states": "ready,failure",
-            "fields": "camera_model,captured_at,file_extension,filename,id,moments_count",
-            "type": types,
+            "fields": MEDIA_SEARCH_FIELDS,
+            "type": self._TYPES_WITH_PHOTOS if self.config.INCLUDE_PHOTOS else self._TYPES_NO_PHOTOS,
             "page": page,
             "per_page": min(self.config.MAX_ITEMS, self.config.PAGE_SIZE)
         }
         
-        response = requests.get(
+        response = self.session.get(
             f"{self.config.BASE_URL}/media/search",
             params=params,
-            headers=self._get_headers(),
-            cookies=self.cookies
+            timeout=self.config.REQUEST_TIMEOUT
         )
         
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
     
     def get_download_info(self, media_id: str) -> Dict:
         """Get download information for a media item"""
-        response = requests.get(
+        response = self.session.get(
             f"{self.config.BASE_URL}/media/{media_id}/download",
-            headers=self._get_headers(),
-            cookies=self.cookies
+            timeout=self.config.REQUEST_TIMEOUT
         )
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
     
     def get_video_highlights(self, video_id: str) -> Dict:
         """Fetch HiLight moments for a video"""
-        response = requests.get(
+        return loads(self.get_video_highlights_raw(video_id))
+    
+    def get_video_highlights_raw(self, video_id: str) -> bytes:
+        """Fetch HiLight moments for a video as the unparsed JSON response body"""
+        response = self.session.get(
             f"{self.config.BASE_URL}/media/{video_id}/moments",
-            headers=self._get_headers(),
-            cookies=self.cookies
+            timeout=self.config.REQUEST_TIMEOUT
         )
         response.raise_for_status()
-        return response.json()
\ No newline at end of file
+        return response.content
\ No newline at end of file
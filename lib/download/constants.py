@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Tuple
 
 @dataclass
 class Config:
@@ -6,4 +7,9 @@ class Config:
     PAGE_SIZE: int = 100
     MAX_ITEMS: int = 1000
     INCLUDE_PHOTOS: bool = False
+    DOWNLOAD_CONCURRENCY: int = 8
+    MAX_CONCURRENT_DOWNLOADS: int = 4
+    DOWNLOAD_RANGE_PARTS: int = 4
+    RANGED_DOWNLOAD_THRESHOLD: int = 32 * 1024 * 1024
+    REQUEST_TIMEOUT: Tuple[float, float] = (5, 60)
     BASE_URL: str = "https://api.gopro.com"
\ No newline at end of file
@@ -1,16 +1,34 @@
 import logging
-from typing import Dict, Optional
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional
 from pathlib import Path
-import requests
-import json
+from tqdm import tqdm
+from tqdm.utils import CallbackIOWrapper
 from .client import GoProAPIClient
+from ..filenames import HIGHLIGHTS_SUFFIX, INDEX_FILENAME, METADATA_SUFFIX
+from ..jsonutil import dumps
 
 logger = logging.getLogger(__name__)
 
+def write_atomic(path: Path, data: bytes):
+    """Write a file via a temporary file so it only ever appears complete"""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
 class MediaDownloader:
     """Handles downloading of media files"""
     def __init__(self, api_client: GoProAPIClient):
         self.api_client = api_client
+        # Metadata calls can run at full concurrency, but bandwidth is shared by all downloads.
+        # Each slot is also the terminal line of its download's progress bar.
+        self._download_slots = queue.Queue()
+        for position in range(api_client.config.MAX_CONCURRENT_DOWNLOADS):
+            self._download_slots.put(position)
     
     def download_media(self, media_item: Dict, output_path: Path, download_gpmf: bool = False):
         """Download media and optionally its GPMF data"""
@@ -30,21 +48,92 @@ class MediaDownloader:
     
     def _download_file(self, url: str, output_path: Path):
         """Download a file with progress indication"""
-        response = requests.get(url, stream=True)
+        # Download under a temporary name so an interrupted download never looks complete
+        part_path = output_path.with_name(f"{output_path.name}.part")
+        try:
+            position = self._download_slots.get()
+            try:
+                self._download_to(url, part_path, output_path.name, position)
+            finally:
+                self._download_slots.put(position)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        os.replace(part_path, output_path)
+    
+    def _download_to(self, url: str, output_path: Path, name: str, position: int):
+        """Stream a URL into output_path"""
+        config = self.api_client.config
+        response = self.api_client.session.get(url, stream=True, timeout=config.REQUEST_TIMEOUT)
+        # An error page must never be saved as the media file
+        response.raise_for_status()
         total_size = int(response.headers.get('content-length', 0))
-        block_size = 8192
+        block_size = 1 << 20
+        
+        with tqdm(total=total_size or None, unit='B', unit_scale=True,
+                  desc=name, leave=False, position=position) as progress:
+            # Fetch large files as parallel byte ranges, since one stream rarely saturates the link
+            if (hasattr(os, 'pwrite')
+                    and response.headers.get('accept-ranges') == 'bytes'
+                    and total_size > config.RANGED_DOWNLOAD_THRESHOLD):
+                response.close()
+                self._download_ranges(url, output_path, total_size, progress.update)
+                return
+            
+            # Copy the raw stream in whole blocks, decoding any content encoding
+            response.raw.decode_content = True
+            with open(output_path, 'wb', buffering=block_size) as f:
+                output = CallbackIOWrapper(progress.update, f, 'write')
+                shutil.copyfileobj(response.raw, output, length=block_size)
+    
+    def _download_ranges(self, url: str, output_path: Path, total_size: int,
+                         progress: Callable[[int], None]):
+        """Download a file in parallel byte ranges written directly into place"""
+        part_size = -(-total_size // self.api_client.config.DOWNLOAD_RANGE_PARTS)
+        ranges = [
+            (start, min(start + part_size, total_size) - 1)
+            for start in range(0, total_size, part_size)
+        ]
+        
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            os.ftruncate(fd, total_size)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(self._download_range, url, fd, start, end, progress)
+                    for start, end in ranges
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            os.close(fd)
+    
+    def _download_range(self, url: str, fd: int, start: int, end: int,
+                        progress: Callable[[int], None]):
+        """Download the inclusive byte range [start, end] of a file into fd"""
+        response = self.api_client.session.get(
+            url,
+            stream=True,
+            headers={'Range': f'bytes={start}-{end}'},
+            timeout=self.api_client.config.REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RuntimeError(f"Server ignored range request for bytes {start}-{end}")
+        
+        offset = start
+        pwrite = os.pwrite
+        for data in response.iter_content(1 << 20):
+            # pwrite may write only part of the chunk
+            view = memoryview(data)
+            while view:
+                written = pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+            progress(len(data))
         
-        with open(output_path, 'wb') as f:
-            if total_size == 0:
-                f.write(response.content)
-            else:
-                downloaded = 0
-                for data in response.iter_content(block_size):
-                    downloaded += len(data)
-                    f.write(data)
-                    percentage = int(100 * downloaded / total_size)
-                    print(f"\rDownloading {output_path.name}: {percentage}%", end="")
-        print()
+        if offset != end + 1:
+            raise IOError(f"Incomplete download of bytes {start}-{end}")
     
     @staticmethod
     def _get_gpmf_url(download_info: Dict) -> Optional[str]:
@@ -62,74 +151,139 @@ class MediaProcessor:
         self.downloader = downloader
         self.output_dir = output_dir
         self.output_dir.mkdir(exist_ok=True)
+        # Names already in the output directory; items whose files are all here are skipped
+        try:
+            self._existing_names = set(os.listdir(self.output_dir))
+        except OSError:
+            self._existing_names = set()
+        self._names_lock = threading.Lock()
+        self._index_file = None
+        self._index_lock = threading.Lock()
     
     def process_media_items(self, download_gpmf: bool = False):
         """Process all media items"""
         try:
-            num_pages = max(self.api_client.config.MAX_ITEMS // self.api_client.config.PAGE_SIZE, 1)
+            config = self.api_client.config
             item_count = 0
             existing_items = 0
             
-            for page in range(1, num_pages + 1):
-                items_response = self.api_client.get_media_items(page)
-                media_items = items_response.get('_embedded', {}).get('media', [])
-                
-                if not media_items:
-                    break
-                    
-                item_count += len(media_items)
+            with open(self.output_dir / INDEX_FILENAME, 'ab') as self._index_file, \
+                    ThreadPoolExecutor(max_workers=config.DOWNLOAD_CONCURRENCY) as executor, \
+                    ThreadPoolExecutor(max_workers=1) as page_fetcher:
+                page = 1
+                next_page = page_fetcher.submit(self.api_client.get_media_items, page)
+                futures = []
                 
-                for media_item in media_items:
-                    if self._process_single_item(media_item, download_gpmf):
-                        existing_items += 1
+                try:
+                    # Keep paging until the API runs out of media or the item limit is reached
+                    while item_count < config.MAX_ITEMS:
+                        items_response = next_page.result()
+                        media_items = items_response.get('_embedded', {}).get('media', [])
+                        
+                        if not media_items:
+                            break
                         
-                if item_count >= self.api_client.config.MAX_ITEMS:
-                    break
+                        # Don't submit more items than are left under the limit
+                        media_items = media_items[:config.MAX_ITEMS - item_count]
+                        item_count += len(media_items)
+                        
+                        # Fetch the next page while this one is being processed
+                        page += 1
+                        if item_count < config.MAX_ITEMS:
+                            next_page = page_fetcher.submit(self.api_client.get_media_items, page)
+                        
+                        futures = [
+                            executor.submit(self._process_single_item, media_item, download_gpmf)
+                            for media_item in media_items
+                        ]
+                        for future in as_completed(futures):
+                            if future.result():
+                                existing_items += 1
+                except BaseException:
+                    # Leaving the executors waits for their queued work, so drop it first
+                    next_page.cancel()
+                    for future in futures:
+                        future.cancel()
+                    raise
 
             logger.info(f"Found {item_count} media items, {existing_items} already downloaded")
                 
         except Exception as e:
             logger.error(f"Error processing media items: {e}")
             raise
+        finally:
+            self._index_file = None
     
     def _process_single_item(self, media_item: Dict, download_gpmf: bool) -> bool:
         """Process a single media item, returns True if item already existed"""
         try:
-            filename = Path(media_item['filename']).with_suffix('').name
-            extension = media_item['file_extension'].lower()
+            filename = Path(media_item['filename']).stem
+            media_name = f"{filename}.{media_item['file_extension'].lower()}"
+            moments_count = media_item['moments_count']
+            
+            if self._is_complete(filename, media_name, moments_count):
+                logger.debug(f"Skipping existing file: {media_name}")
+                return True
             
             # Handle highlights
-            if media_item['moments_count'] > 0:
+            if moments_count > 0:
                 self._save_highlights(media_item, filename)
             
             # Save metadata
             self._save_metadata(media_item, filename)
             
             # Download media if it doesn't exist
-            media_path = self.output_dir / f"{filename}.{extension}"
-            if media_path.exists():
-                logger.debug(f"Skipping existing file: {filename}.{extension}")
+            if not self._claim_name(media_name):
+                logger.debug(f"Skipping existing file: {media_name}")
                 return True
                 
-            self.downloader.download_media(media_item, media_path, download_gpmf)
+            self.downloader.download_media(media_item, self.output_dir / media_name, download_gpmf)
             return False
             
         except Exception as e:
             logger.error(f"Error processing {media_item.get('filename', 'unknown')}: {e}")
             return False
     
+    def _is_complete(self, filename: str, media_name: str, moments_count: int) -> bool:
+        """Check whether the media file and all its sidecars were already saved"""
+        names = self._existing_names
+        if media_name not in names or f"{filename}{METADATA_SUFFIX}" not in names:
+            return False
+        return moments_count == 0 or f"{filename}{HIGHLIGHTS_SUFFIX}" in names
+    
+    def _claim_name(self, name: str) -> bool:
+        """Reserve an output filename, returning False if it already exists or is taken"""
+        with self._names_lock:
+            if name in self._existing_names:
+                return False
+            self._existing_names.add(name)
+            return True
+    
     def _save_highlights(self, media_item: Dict, filename: str):
         """Save highlights data if available"""
-        highlights_path = self.output_dir / f"{filename}_highlights.json"
-        if not highlights_path.exists():
-            logger.info(f"Found {media_item['moments_count']} HiLight tags in {filename}")
-            highlights = self.api_client.get_video_highlights(media_item['id'])
-            with open(highlights_path, 'w') as f:
-                json.dump(highlights, f, indent=2)
+        highlights_path = self.output_dir / f"{filename}{HIGHLIGHTS_SUFFIX}"
+        if self._claim_name(highlights_path.name):
+            logger.debug(f"Found {media_item['moments_count']} HiLight tags in {filename}")
+            # Saved exactly as received
+            highlights = self.api_client.get_video_highlights_raw(media_item['id'])
+            write_atomic(highlights_path, highlights)
     
     def _save_metadata(self, media_item: Dict, filename: str):
         """Save media item metadata"""
-        metadata_path = self.output_dir / f"{filename}_metadata.json"
-        if not metadata_path.exists():
-            with open(metadata_path, 'w') as f:
-                json.dump(media_item, f, indent=2)
\ No newline at end of file
+        metadata_path = self.output_dir / f"{filename}{METADATA_SUFFIX}"
+        if self._claim_name(metadata_path.name):
+            # Compact, since only the organizer reads these
+            write_atomic(metadata_path, dumps(media_item, indent=False))
+            self._append_to_index(media_item, filename)
+    
+    def _append_to_index(self, media_item: Dict, filename: str):
+        """Record the media file's capture time in the download index"""
+        if self._index_file is None:
+            return
+        entry = {
+            "path": f"{filename}.{media_item['file_extension'].lower()}",
+            "captured_at": media_item['captured_at']
+        }
+        with self._index_lock:
+            self._index_file.write(dumps(entry, indent=False) + b'\n')
+            self._index_file.flush()
\ No newline at end of file
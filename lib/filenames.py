@@ -0,0 +1,10 @@
+# A media file downloaded as "<stem>.<ext>" is saved next to "<stem>_metadata.json",
+# and "<stem>_highlights.json" when it has HiLight tags. The organizer finds a
+# video's sidecars purely from these names, so both sides must build them from
+# the same suffixes. <stem> is the cloud filename without its extension.
+METADATA_SUFFIX = '_metadata.json'
+HIGHLIGHTS_SUFFIX = '_highlights.json'
+
+# One line per download with its capture time, read by the organizer in place of
+# the metadata files
+INDEX_FILENAME = 'index.jsonl'
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Union
+from .filemetadata import load_captured_at
+
+class CaptureDateCache:
+    """Caches capture dates of metadata files so unchanged files aren't re-parsed"""
+    COMMIT_BATCH_SIZE = 500
+
+    def __init__(self, db_path: Union[str, Path]):
+        # Shared between organizer worker threads, with access serialized by the lock
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS capture_dates "
+            "(path TEXT PRIMARY KEY, mtime REAL, size INTEGER, captured_at TEXT)"
+        )
+        # Media files whose embedded dates exiftool has written, as they were right after
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS exif_dates "
+            "(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)"
+        )
+        self._pending = 0
+
+    @staticmethod
+    def _key(path: Union[str, Path]) -> str:
+        """Build the key a file is stored under, the same however its path was spelled"""
+        return os.path.abspath(path)
+
+    def load_captured_at(self, metadata_path: Path) -> str:
+        """Return a metadata file's capture time, parsing the file only if it changed"""
+        stat = metadata_path.stat()
+        key = self._key(metadata_path)
+
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime, size, captured_at FROM capture_dates WHERE path = ?", (key,)
+            ).fetchone()
+        if row and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            return row[2]
+
+        captured_at = load_captured_at(metadata_path)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO capture_dates VALUES (?, ?, ?, ?)",
+                (key, stat.st_mtime, stat.st_size, captured_at)
+            )
+            self._note_write()
+
+        return captured_at
+
+    def remove(self, metadata_path: Path):
+        """Forget a metadata file that has been moved away"""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM capture_dates WHERE path = ?", (self._key(metadata_path),)
+            )
+            self._note_write()
+
+    def has_exif_dates(self, media_path: Union[str, Path], stat: os.stat_result) -> bool:
+        """Check whether exiftool wrote a media file's dates and it hasn't changed since"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, size FROM exif_dates WHERE path = ?", (self._key(media_path),)
+            ).fetchone()
+        return row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size
+
+    def record_exif_dates(self, media_path: Union[str, Path], stat: os.stat_result):
+        """Remember that exiftool wrote a media file's dates"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO exif_dates VALUES (?, ?, ?)",
+                (self._key(media_path), stat.st_mtime_ns, stat.st_size)
+            )
+            self._note_write()
+
+    def remove_exif_dates(self, media_path: Path):
+        """Forget a media file that has been moved away"""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM exif_dates WHERE path = ?", (self._key(media_path),)
+            )
+            self._note_write()
+
+    def _note_write(self):
+        """Count a write, committing once enough are pending; called with the lock held"""
+        self._pending += 1
+        if self._pending >= self.COMMIT_BATCH_SIZE:
+            self._commit()
+
+    def _commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def flush(self):
+        """Commit pending cache entries"""
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """Commit pending entries and close the database"""
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,145 @@
+import logging
+import os
+import queue
+import subprocess
+import threading
+from typing import List, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ExifToolProcess:
+    """A single exiftool process kept open to run many commands"""
+    def __init__(self):
+        self._command_id = 0
+        self._process = subprocess.Popen(
+            ['exiftool', '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8'
+        )
+    
+    def send(self, commands: List[List[str]]) -> List[str]:
+        """Write commands without waiting for them, returning the marker that ends each response"""
+        markers = []
+        for args in commands:
+            # Numbering each command means a stray marker can't be mistaken for this one's end
+            self._command_id += 1
+            marker = f'{{ready{self._command_id}}}'
+            markers.append(marker)
+            command = '\n'.join(args + ['-echo4', marker, f'-execute{self._command_id}'])
+            self._process.stdin.write(command + '\n')
+        self._process.stdin.flush()
+        return markers
+    
+    def receive(self, markers: List[str]) -> List[Tuple[str, str]]:
+        """Read the stdout and stderr of previously sent commands"""
+        return [
+            (self._read_response(self._process.stdout, marker),
+             self._read_response(self._process.stderr, marker))
+            for marker in markers
+        ]
+    
+    def _read_response(self, stream: TextIO, marker: str) -> str:
+        """Read command output up to the ready marker"""
+        lines = []
+        for line in stream:
+            if line.rstrip() == marker:
+                return ''.join(lines)
+            lines.append(line)
+        raise RuntimeError("exiftool exited unexpectedly")
+    
+    def close(self):
+        """Shut down the exiftool process"""
+        if self._process.poll() is None:
+            self._process.stdin.write('-stay_open\nFalse\n')
+            self._process.stdin.flush()
+            self._process.wait()
+    
+    def kill(self):
+        """Stop the exiftool process without waiting for its pending commands"""
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+class ExifPool:
+    """Runs exiftool commands across several stay_open processes"""
+    # Commands written to a process before any response is read; kept small enough
+    # that exiftool's replies fit in the pipe buffers and neither side blocks
+    BATCH_SIZE = 128
+    
+    def __init__(self, size: int):
+        self._size = size
+        # Each slot holds a process, or None once its process has failed
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(ExifToolProcess())
+        # Processes are checked out in sets, which must not interleave between callers
+        self._checkout_lock = threading.Lock()
+    
+    def execute_many(self, commands: List[List[str]]) -> List[Tuple[str, str]]:
+        """Run exiftool commands and return each one's stdout and stderr, in order"""
+        # Spread the commands evenly so every process gets a share of a small call
+        batch_size = max(1, min(self.BATCH_SIZE, -(-len(commands) // self._size)))
+        batches = [commands[i:i + batch_size] for i in range(0, len(commands), batch_size)]
+        results = []
+        for start in range(0, len(batches), self._size):
+            round_batches = batches[start:start + self._size]
+            with self._checkout_lock:
+                slots = [self._idle.get() for _ in round_batches]
+            processes = []
+            finished = []
+            try:
+                for process in slots:
+                    # An emptied slot gets a new process when it's next used
+                    processes.append(process or ExifToolProcess())
+                # Every process works on its batch before any responses are collected
+                pending = [
+                    (process, process.send(batch))
+                    for process, batch in zip(processes, round_batches)
+                ]
+                for process, markers in pending:
+                    results.extend(process.receive(markers))
+                    finished.append(process)
+            finally:
+                for process in processes:
+                    if process not in finished:
+                        # Its output may be unread or the process gone, so it can't be reused
+                        process.kill()
+                for process in finished + [None] * (len(slots) - len(finished)):
+                    self._idle.put(process)
+        return results
+    
+    def close(self):
+        """Shut down all exiftool processes"""
+        for _ in range(self._size):
+            process = self._idle.get()
+            if process is not None:
+                process.close()
+
+# Shared by every FileMetadataUpdater, so the number of exiftool processes stays fixed
+_pool = None
+_pool_users = 0
+_pool_lock = threading.Lock()
+
+def acquire_exif_pool() -> ExifPool:
+    """Get the shared exiftool pool, starting it on first use"""
+    global _pool, _pool_users
+    with _pool_lock:
+        if _pool is None:
+            # Rewriting a video is mostly disk I/O, so a few processes are enough to keep it busy
+            size = min(4, os.cpu_count() or 1)
+            logger.debug("Starting %d exiftool processes", size)
+            _pool = ExifPool(size)
+        _pool_users += 1
+        return _pool
+
+def release_exif_pool():
+    """Release the shared exiftool pool, shutting it down after its last user"""
+    global _pool, _pool_users
+    with _pool_lock:
+        _pool_users -= 1
+        if _pool_users == 0 and _pool is not None:
+            _pool.close()
+            _pool = None
\ No newline at end of file
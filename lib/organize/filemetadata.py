@@ -1,19 +1,45 @@
-import json
 import logging
+import mmap
 import shutil
 import subprocess
 import os
+import re
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict
+from typing import List, Tuple
+from .exiftool import acquire_exif_pool, release_exif_pool
+from ..jsonutil import loads
 
 logger = logging.getLogger(__name__)
 
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T')
+_CAPTURED_AT_RE = re.compile(rb'"captured_at"\s*:\s*"([^"\\]*)"')
+
+# Metadata files at least this large are searched through a memory map
+_MMAP_THRESHOLD = 1024 * 1024
+
+# Capture times are local wall-clock times, and the local timezone is treated as a
+# fixed offset from UTC
+_UTC_OFFSET = datetime.now().astimezone().utcoffset()
+
 class FileMetadataUpdater:
     """Updates media file metadata using exiftool"""
-    
-    def __init__(self):
+    def __init__(self, native_only: bool = False, fast: bool = False, date_cache=None):
+        # Native-only mode just sets filesystem timestamps, so exiftool isn't needed
+        self.native_only = native_only
+        self.fast = fast
+        # Records which files exiftool has already updated, if given
+        self.date_cache = date_cache
+        self._pool = None
+        self._setfile = shutil.which('SetFile')
+        if self._setfile:
+            logger.debug(f"Setting file dates with {self._setfile}")
+        if native_only:
+            return
+        
         self._check_exiftool()
+        # Commands run on the shared pool of stay_open exiftool processes
+        self._pool = acquire_exif_pool()
     
     def _check_exiftool(self):
         """Verify exiftool is installed"""
@@ -25,84 +51,171 @@ class FileMetadataUpdater:
                 "- Windows: Download from https://exiftool.org"
             )
     
+    def close(self):
+        """Release the exiftool processes"""
+        if self._pool is not None:
+            self._pool = None
+            release_exif_pool()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def update_file_dates(self, media_path: Path, captured_at: str) -> bool:
         """Update file's creation and modification dates"""
-        try:
-            # Convert ISO date string to datetime, treating it as local time
-            naive_date = datetime.strptime(captured_at.replace('Z', ''), '%Y-%m-%dT%H:%M:%S')
-            
-            # Attach local timezone
-            local_tz = datetime.now().astimezone().tzinfo
-            local_date = naive_date.replace(tzinfo=local_tz)
-            
-            # Format for exiftool (UTC)
+        return self.update_files_dates([(media_path, captured_at)])[0]
+    
+    def update_files_dates(self, files: List[Tuple[Path, str]]) -> List[bool]:
+        """Update the dates of several files, pipelining their exiftool commands"""
+        results = [False] * len(files)
+        pending = []
+        for i, (media_path, captured_at) in enumerate(files):
             try:
-                UTC = datetime.UTC
-            except AttributeError:
-                from datetime import timezone
-                UTC = timezone.utc
+                path = os.fspath(media_path)
                 
-            utc_date = local_date.astimezone(UTC)
-            formatted_date = utc_date.strftime('%Y:%m:%d %H:%M:%S+00:00')
-            
-            # Format for macOS
-            macos_date = naive_date.strftime('%m/%d/%Y %H:%M:%S')
-            
-            # Update using exiftool
-            exif_cmd = [
-                'exiftool',
-                '-overwrite_original',
-                '-preserveModifyDate',
-                '-P',
-                f'-AllDates={formatted_date}',
-                f'-FileCreateDate={formatted_date}',
-                f'-FileModifyDate={formatted_date}',
-                str(media_path)
-            ]
-            
-            exif_result = subprocess.run(exif_cmd, capture_output=True, text=True)
-            
-            if exif_result.returncode != 0:
-                logger.error(f"Failed to update metadata: {exif_result.stderr}")
-                return False
-            
-            # Try SetFile for macOS
-            if shutil.which('SetFile'):
-                setfile_cmd = [
-                    'SetFile',
-                    '-d', f'{macos_date}',
-                    '-m', f'{macos_date}',
-                    str(media_path)
-                ]
+                # Convert ISO date string to datetime, treating it as local time
+                # (fromisoformat only accepts a trailing Z from Python 3.11)
+                naive_date = datetime.fromisoformat(captured_at[:-1] if captured_at.endswith('Z') else captured_at)
+                
+                # Integer nanoseconds, matching st_mtime_ns exactly
+                timestamp_ns = int(naive_date.timestamp()) * 1_000_000_000 + naive_date.microsecond * 1000
+                
+                # The modification time is set last, so a match means an earlier run already
+                # finished, though only the cache can tell if that run also wrote the EXIF dates
+                stat = os.stat(path)
+                if stat.st_mtime_ns == timestamp_ns and (self.native_only or self._has_exif_dates(path, stat)):
+                    logger.debug("Metadata already up to date for %s", path)
+                    results[i] = True
+                    continue
                 
-                try:
-                    subprocess.run(setfile_cmd, capture_output=True, text=True, check=True)
-                except subprocess.CalledProcessError as e:
-                    logger.warning(f"SetFile command failed (non-critical): {e}")
+                pending.append((i, path, naive_date, timestamp_ns))
+            except Exception as e:
+                logger.error("Error updating metadata: %s", e)
+        
+        if self.native_only:
+            for i, path, naive_date, timestamp_ns in pending:
+                results[i] = self._finish_update(path, naive_date, timestamp_ns, '')
+            return results
+        
+        # The pool runs every pending file's command before returning
+        try:
+            responses = self._pool.execute_many([
+                self._exif_args(path, naive_date) for _, path, naive_date, _ in pending
+            ])
+        except Exception as e:
+            logger.error("Error updating metadata: %s", e)
+            return results
+        
+        for (i, path, naive_date, timestamp_ns), (_, exif_errors) in zip(pending, responses):
+            results[i] = self._finish_update(path, naive_date, timestamp_ns, exif_errors)
+            if results[i] and self.date_cache is not None:
+                self._record_exif_dates(path)
+        
+        return results
+    
+    def _has_exif_dates(self, path: str, stat: os.stat_result) -> bool:
+        """Check the cache for a file whose EXIF dates were already written"""
+        return self.date_cache is not None and self.date_cache.has_exif_dates(path, stat)
+    
+    def _record_exif_dates(self, path: str):
+        """Record in the cache that a file's EXIF dates were written"""
+        try:
+            self.date_cache.record_exif_dates(path, os.stat(path))
+        except Exception as e:
+            # Only costs a redundant exiftool call on the next run
+            logger.warning("Could not record metadata update for %s: %s", path, e)
+    
+    def _exif_args(self, path: str, naive_date: datetime) -> List[str]:
+        """Build the exiftool arguments that set a file's dates"""
+        # Format for exiftool (UTC)
+        utc = naive_date - _UTC_OFFSET
+        formatted_date = (f'{utc.year:04d}:{utc.month:02d}:{utc.day:02d} '
+                          f'{utc.hour:02d}:{utc.minute:02d}:{utc.second:02d}+00:00')
+        
+        # The modification date is always set afterwards by SetFile or os.utime
+        args = [
+            '-overwrite_original',
+            '-preserveModifyDate',
+            '-P',
+            f'-AllDates={formatted_date}',
+            path
+        ]
+        if not self._setfile:
+            # SetFile sets the creation date itself where it's available
+            args.insert(-1, f'-FileCreateDate={formatted_date}')
+        if self.fast:
+            # Skips MakerNotes and stops scanning QuickTime files at the media data
+            args.insert(0, '-fast2')
+        return args
+    
+    def _finish_update(self, path: str, naive_date: datetime, timestamp_ns: int,
+                       exif_errors: str) -> bool:
+        """Check exiftool's result for a file and set its filesystem dates"""
+        try:
+            if any(line.startswith('Error') for line in exif_errors.splitlines()):
+                logger.error("Failed to update metadata: %s", exif_errors)
+                return False
             
-            # Use touch as fallback
-            os.utime(media_path, (naive_date.timestamp(), naive_date.timestamp()))
+            # SetFile (macOS only) sets both the creation and modification dates,
+            # so os.utime is only needed where it's missing or fails
+            if not (self._setfile and self._set_file_dates(path, naive_date)):
+                os.utime(path, ns=(timestamp_ns, timestamp_ns))
             
-            logger.info(f"Updated metadata for {media_path}")
+            logger.debug("Updated metadata for %s", path)
             return True
             
         except Exception as e:
-            logger.error(f"Error updating metadata: {e}")
+            logger.error("Error updating metadata: %s", e)
+            return False
+
+    def _set_file_dates(self, path: str, naive_date: datetime) -> bool:
+        """Set a file's creation and modification dates with SetFile"""
+        # Format for macOS
+        macos_date = (f'{naive_date.month:02d}/{naive_date.day:02d}/{naive_date.year:04d} '
+                      f'{naive_date.hour:02d}:{naive_date.minute:02d}:{naive_date.second:02d}')
+        setfile_cmd = [
+            self._setfile,
+            '-d', f'{macos_date}',
+            '-m', f'{macos_date}',
+            path
+        ]
+        
+        # Only stderr is ever looked at, and only decoded if the command fails
+        try:
+            subprocess.run(setfile_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.warning("SetFile command failed (non-critical): %s %s",
+                           e, e.stderr.decode('utf-8', 'replace').strip())
             return False
 
-def load_metadata(metadata_path: Path) -> Optional[Dict]:
-    """Load metadata from JSON file"""
-    try:
-        with open(metadata_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading metadata from {metadata_path}: {e}")
-        return None
+def load_captured_at(metadata_path: Path) -> str:
+    """Read just the capture time from a metadata file"""
+    with open(metadata_path, 'rb') as f:
+        # Small files, which are nearly all of them, are read directly
+        if os.fstat(f.fileno()).st_size < _MMAP_THRESHOLD:
+            return _parse_captured_at(f.read(), metadata_path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _parse_captured_at(data, metadata_path)
 
-def get_capture_date(metadata: Dict) -> str:
-    """Extract capture date from metadata"""
+def _parse_captured_at(data, metadata_path: Path) -> str:
+    """Extract the capture time from a metadata file's contents"""
+    # Media items are flat objects, so the first captured_at key is the item's own
+    # and the rest of the document never needs to be decoded
+    match = _CAPTURED_AT_RE.search(data)
+    if match:
+        return match.group(1).decode()
+    
+    metadata = loads(bytes(data))
     if 'captured_at' not in metadata:
-        raise ValueError("No 'captured_at' field found in metadata")
-        
-    capture_date = datetime.fromisoformat(metadata['captured_at'].replace('Z', ''))
-    return capture_date.strftime('%Y-%m-%d')
\ No newline at end of file
+        raise ValueError(f"No 'captured_at' field found in {metadata_path.name}")
+    return metadata['captured_at']
+
+def get_capture_date(captured_at: str) -> str:
+    """Extract the capture date from a capture time"""
+    # ISO 8601 timestamps already start with the date in the folder format
+    if not _ISO_DATE_RE.match(captured_at):
+        raise ValueError(f"Invalid capture date: {captured_at}")
+    return captured_at[:10]
@@ -1,128 +1,324 @@
+import errno
 import logging
+import os
 import shutil
-from datetime import datetime
+import sys
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Generator, List, Tuple
-import json
-from .metadata import FileMetadataUpdater
+from typing import Dict, Generator, List, Optional, Set, Tuple
+from tqdm import tqdm
+from .filemetadata import FileMetadataUpdater, get_capture_date
+from .date_cache import CaptureDateCache
+from ..filenames import HIGHLIGHTS_SUFFIX, INDEX_FILENAME, METADATA_SUFFIX
+from ..jsonutil import loads
 
 logger = logging.getLogger(__name__)
 
+# copy_file_range errors that mean the kernel or filesystem can't do the copy itself
+_COPY_FILE_RANGE_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+
+# Chunk size for the cases where shutil falls back to a read/write loop
+shutil.COPY_BUFSIZE = 4 * 1024 * 1024
+
+def find_video_files_with_names(source_dir: Path, recursive: bool = False,
+                                exclude: Optional[Path] = None
+                                ) -> Generator[Tuple[Path, Set[str]], None, None]:
+    """Find all MP4 files, each paired with the names of all entries in its directory"""
+    # Compared as absolute paths, since a relative source like '.' yields './name' entries
+    excluded = os.path.abspath(exclude) if exclude else None
+    # scandir entries carry their file type
+    pending = deque([source_dir])
+    while pending:
+        names = set()
+        videos = []
+        with os.scandir(pending.popleft()) as entries:
+            for entry in entries:
+                names.add(entry.name)
+                if entry.is_file(follow_symlinks=False) and entry.name.lower().endswith('.mp4'):
+                    videos.append(Path(entry.path))
+                elif (recursive and entry.is_dir(follow_symlinks=False)
+                        and os.path.abspath(entry.path) != excluded):
+                    pending.append(entry.path)
+        for video_path in videos:
+            yield video_path, names
+
 def find_video_files(source_dir: Path, recursive: bool = False) -> Generator[Path, None, None]:
     """Find all MP4 files in the source directory"""
-    pattern = "**/*.mp4" if recursive else "*.mp4"
-    yield from source_dir.glob(pattern)
+    for video_path, _ in find_video_files_with_names(source_dir, recursive):
+        yield video_path
+
+def list_file_names(directory: Path) -> Set[str]:
+    """List the names of all entries in a directory"""
+    with os.scandir(directory) as entries:
+        return {entry.name for entry in entries}
+
+def _stat(path: Path) -> Optional[os.stat_result]:
+    """Stat a path, returning None if it doesn't exist"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+def _windows_copy_file(src: Path, dest: Path) -> None:
+    """Copy a file with the Windows CopyFile2 API"""
+    import ctypes
+    copy_file2 = ctypes.windll.kernel32.CopyFile2
+    copy_file2.argtypes = (ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_void_p)
+    # An HRESULT return type makes ctypes raise OSError on failure
+    copy_file2.restype = ctypes.HRESULT
+    copy_file2(str(src), str(dest), None)
+
+def fast_copy(src: Path, dest: Path) -> None:
+    """Copy a file and its metadata, keeping the data copy inside the kernel where possible"""
+    dest_stat = _stat(dest)
+    if dest_stat is not None and os.path.samestat(os.stat(src), dest_stat):
+        raise shutil.SameFileError(f"{src} and {dest} are the same file")
+    
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+                # Copies whole extents per call, and may reflink on filesystems like XFS or Btrfs
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            shutil.copystat(src, dest)
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+                raise
+    elif sys.platform == 'win32':
+        try:
+            _windows_copy_file(src, dest)
+            shutil.copystat(src, dest)
+            return
+        except (AttributeError, OSError) as e:
+            logger.debug(f"CopyFile2 failed for {src.name}, falling back to shutil: {e}")
+    
+    shutil.copy2(src, dest)
+
+def move_file(src: Path, dest: Path) -> None:
+    """Move a file, using a plain rename unless it has to cross filesystems"""
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dest)
 
-def find_related_files(video_path: Path) -> Tuple[Path, List[Path]]:
-    """Find metadata and optional highlights files"""
+def find_related_files(video_path: Path, names: Set[str]) -> Tuple[Path, List[Path]]:
+    """Find metadata and optional highlights files among the names in the video's directory"""
     files = []
     
     # Find required metadata file
-    metadata_path = video_path.with_name(f"{video_path.stem}_metadata.json")
-    if not metadata_path.exists():
+    metadata_name = f"{video_path.stem}{METADATA_SUFFIX}"
+    if metadata_name not in names:
         raise FileNotFoundError(f"No metadata file found for {video_path.name}")
+    metadata_path = video_path.with_name(metadata_name)
     
     # Find optional highlights file
-    highlights_path = video_path.with_name(f"{video_path.stem}_highlights.json")
-    if highlights_path.exists():
-        files.append(highlights_path)
+    highlights_name = f"{video_path.stem}{HIGHLIGHTS_SUFFIX}"
+    if highlights_name in names:
+        files.append(video_path.with_name(highlights_name))
     
     return metadata_path, files
 
-def load_metadata(metadata_path: Path) -> dict:
-    """Load and validate metadata file"""
+def load_capture_index(source_dir: Path) -> Dict[str, str]:
+    """Load capture times recorded by the downloader, keyed by media filename"""
+    index = {}
     try:
-        with open(metadata_path) as f:
-            metadata = json.load(f)
-        
-        if 'captured_at' not in metadata:
-            raise ValueError("No 'captured_at' field found in metadata")
-            
-        return metadata
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse metadata JSON: {e}")
-        return None
-    except ValueError as e:
-        logger.error(f"Invalid date format in metadata: {e}")
-        return None
+        with open(source_dir / INDEX_FILENAME, 'rb') as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                    index[entry['path']] = entry['captured_at']
+                except (ValueError, KeyError):
+                    # Tolerate a line left incomplete by an interrupted download
+                    continue
+    except FileNotFoundError:
+        pass
+    return index
 
-def get_capture_date(metadata: dict) -> str:
-    """Extract capture date from metadata file"""
-    if 'captured_at' not in metadata:
-        raise ValueError("No 'captured_at' field found in metadata")
-        
-    capture_date = datetime.fromisoformat(metadata['captured_at'].replace('Z', ''))
-    return capture_date.strftime('%Y-%m-%d')
+@dataclass
+class VideoTask:
+    """A video found by the scan, with everything needed to organize it"""
+    video_path: Path
+    metadata_path: Path
+    related_files: List[Path]
+    captured_at: str
+    date_folder: str
 
 class VideoOrganizer:
     """Handles organizing videos into date-based folders"""
-    def __init__(self, source_dir: Path, *, copy: bool = False, dry_run: bool = False):
+    def __init__(self, source_dir: Path, *, copy: bool = False, dry_run: bool = False,
+                 native_only: bool = False, fast: bool = False):
         self.source_dir = source_dir
         self.copy = copy
         self.dry_run = dry_run
-        self.metadata_updater = FileMetadataUpdater()
         
         # Create base output directory
         self.output_dir = source_dir / 'organized_videos'
         if not dry_run:
             self.output_dir.mkdir(exist_ok=True)
+        
+        # Capture times of unchanged metadata files are kept across runs
+        cache_path = ':memory:' if dry_run else source_dir / '.gopro_dates.sqlite'
+        self.date_cache = CaptureDateCache(cache_path)
+        # A dry run never updates dates, so it starts no exiftool processes
+        self.metadata_updater = FileMetadataUpdater(native_only=native_only or dry_run, fast=fast,
+                                                    date_cache=self.date_cache)
+        self.capture_index = load_capture_index(source_dir)
+    
+    def close(self):
+        """Release the exiftool processes and cache database"""
+        self.metadata_updater.close()
+        self.date_cache.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def _move_or_copy_file(self, src: Path, dest: Path) -> None:
         """Move or copy file based on settings"""
         if self.dry_run:
             op_name = 'copy' if self.copy else 'move'
-            logger.info(f"Would {op_name} {src.name} to {dest}")
+            logger.info("Would %s %s to %s", op_name, src.name, dest)
             return
             
-        operation = shutil.copy2 if self.copy else shutil.move
-        operation(src, dest)
+        if self.copy:
+            fast_copy(src, dest)
+        else:
+            move_file(src, dest)
         op_name = 'Copied' if self.copy else 'Moved'
-        logger.info(f"{op_name} {src.name} to {dest}")
+        logger.debug("%s %s to %s", op_name, src.name, dest)
     
-    def process_video(self, video_path: Path) -> bool:
-        """Process a single video file and its related files"""
+    def _resolve_video(self, video_path: Path, names: Set[str]) -> VideoTask:
+        """Find a video's related files, capture time and date folder"""
+        metadata_path, related_files = find_related_files(video_path, names)
+        # Prefer the downloader's index over reading the metadata file
+        captured_at = None
+        if video_path.parent == self.source_dir:
+            captured_at = self.capture_index.get(video_path.name)
+        if not captured_at:
+            captured_at = self.date_cache.load_captured_at(metadata_path)
+        date_folder = get_capture_date(captured_at)
+        return VideoTask(video_path, metadata_path, related_files, captured_at, date_folder)
+    
+    def _try_resolve_video(self, video: Tuple[Path, Set[str]]) -> Optional[VideoTask]:
+        """Resolve a scanned video, logging instead of raising on failure"""
+        video_path, names = video
+        try:
+            return self._resolve_video(video_path, names)
+        except Exception as e:
+            self._log_error(video_path, e)
+            return None
+    
+    def _organize_video(self, task: VideoTask, date_dir: Path) -> bool:
+        """Move a video and its related files into an existing date folder"""
         try:
-            # Find related files
-            metadata_path, related_files = find_related_files(video_path)
-            metadata = load_metadata(metadata_path)
-            
-            # Get date and create folder
-            date_folder = get_capture_date(metadata)
-            date_dir = self.output_dir / date_folder
-            
-            if not self.dry_run:
-                # Update metadata dates
-                if not self.metadata_updater.update_file_dates(video_path, metadata['captured_at']):
-                    return False
-                
-                date_dir.mkdir(exist_ok=True)
-            
             # Move/copy video file
-            dest_path = date_dir / video_path.name
-            self._move_or_copy_file(video_path, dest_path)
+            self._move_or_copy_file(task.video_path, date_dir / task.video_path.name)
+            if not (self.copy or self.dry_run):
+                self.date_cache.remove_exif_dates(task.video_path)
             
             # Move/copy metadata file
-            self._move_or_copy_file(metadata_path, date_dir / metadata_path.name)
+            self._move_or_copy_file(task.metadata_path, date_dir / task.metadata_path.name)
+            if not (self.copy or self.dry_run):
+                # Its cache entry is keyed by the old path, which no longer exists
+                self.date_cache.remove(task.metadata_path)
             
             # Move/copy any related files
-            for related_file in related_files:
+            for related_file in task.related_files:
                 self._move_or_copy_file(related_file, date_dir / related_file.name)
             
             return True
             
         except Exception as e:
-            import traceback
-            logger.error(f"Error processing {video_path}: {e}")
-            print(traceback.format_exc())
+            self._log_error(task.video_path, e)
+            return False
+    
+    def _log_error(self, video_path: Path, error: Exception):
+        """Report a video that couldn't be processed"""
+        logger.error("Error processing %s: %s", video_path, error)
+        logger.debug("Traceback for %s", video_path, exc_info=True)
+    
+    def process_video(self, video_path: Path, names: Optional[Set[str]] = None) -> bool:
+        """Process a single video file and its related files"""
+        try:
+            if names is None:
+                names = list_file_names(video_path.parent)
+            task = self._resolve_video(video_path, names)
+        except Exception as e:
+            self._log_error(video_path, e)
             return False
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            processed, _ = self._apply_tasks(executor, [task])
+        return processed == 1
 
     def process_directory(self, recursive: bool = False) -> Tuple[int, int]:
         """Process all videos in directory"""
+        # Stage 1: find the videos. The directory scan also provides the names for
+        # finding related files, and the output folder is skipped
+        videos = list(find_video_files_with_names(self.source_dir, recursive, self.output_dir))
+        
+        # Videos are independent and mostly wait on file I/O, so handle several at once
+        max_workers = min(8, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Stage 2: read every video's capture date before anything is changed
+            tasks, errors = self._resolve_tasks(executor, videos)
+            
+            # Stage 3: update dates and move files, one date folder at a time
+            processed, apply_errors = self._apply_tasks(executor, tasks)
+        
+        return processed, errors + apply_errors
+    
+    def _resolve_tasks(self, executor: ThreadPoolExecutor,
+                       videos: List[Tuple[Path, Set[str]]]) -> Tuple[List[VideoTask], int]:
+        """Resolve scanned videos into tasks, returning them with the number that failed"""
+        tasks = []
+        errors = 0
+        try:
+            # Most dates come from the index, but cache misses read metadata files
+            for task in executor.map(self._try_resolve_video, videos):
+                if task is None:
+                    errors += 1
+                else:
+                    tasks.append(task)
+        finally:
+            self.date_cache.flush()
+        return tasks, errors
+    
+    def _apply_tasks(self, executor: ThreadPoolExecutor, tasks: List[VideoTask]) -> Tuple[int, int]:
+        """Update dates and move the files of resolved videos, returning processed and error counts"""
         processed = 0
         errors = 0
         
-        for video_path in find_video_files(self.source_dir, recursive):
-            if self.process_video(video_path):
+        by_date: Dict[str, List[VideoTask]] = {}
+        for task in tasks:
+            by_date.setdefault(task.date_folder, []).append(task)
+        
+        futures = []
+        # Each date folder is created, then all of that day's videos are moved into it
+        for date_folder, day_tasks in by_date.items():
+            date_dir = self.output_dir / date_folder
+            if not self.dry_run:
+                # Update the whole day's dates in one batch of exiftool commands
+                updated = self.metadata_updater.update_files_dates(
+                    [(task.video_path, task.captured_at) for task in day_tasks]
+                )
+                errors += updated.count(False)
+                day_tasks = [task for task, ok in zip(day_tasks, updated) if ok]
+                if not day_tasks:
+                    continue
+                date_dir.mkdir(exist_ok=True)
+            futures.extend(executor.submit(self._organize_video, task, date_dir) for task in day_tasks)
+        
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           desc="Organizing", unit="file"):
+            if future.result():
                 processed += 1
             else:
                 errors += 1
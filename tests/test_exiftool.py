@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+import pytest
+from lib.organize import exiftool
+from lib.organize.exiftool import ExifPool
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="stand-in script needs a shebang")
+
+# Speaks the -stay_open protocol: each command's stdout is "<pid> <args>", '-error' adds an
+# error line to its stderr, and '-die' makes the process exit without answering
+STAND_IN = '''\
+import os, sys
+args = []
+for line in sys.stdin:
+    line = line.rstrip('\\n')
+    if line.startswith('-execute'):
+        marker = None
+        if '-echo4' in args:
+            i = args.index('-echo4')
+            marker = args[i + 1]
+            del args[i:i + 2]
+        if '-die' in args:
+            sys.exit(1)
+        sys.stdout.write('%d %s\\n' % (os.getpid(), ' '.join(args)))
+        if '-error' in args:
+            sys.stderr.write('Error: failed\\n')
+        if marker:
+            sys.stderr.write(marker + '\\n')
+            sys.stderr.flush()
+        sys.stdout.write('{ready%s}\\n' % line[len('-execute'):])
+        sys.stdout.flush()
+        args = []
+    elif args[-1:] == ['-stay_open'] and line == 'False':
+        break
+    else:
+        args.append(line)
+'''
+
+@pytest.fixture(autouse=True)
+def stand_in_exiftool(tmp_path, monkeypatch):
+    script = tmp_path / 'exiftool'
+    script.write_text(f'#!{sys.executable}\n{STAND_IN}')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+@pytest.fixture
+def pool():
+    pool = ExifPool(4)
+    yield pool
+    pool.close()
+
+def _pid(response):
+    return response[0].split()[0]
+
+def test_results_are_returned_in_order(pool):
+    commands = [[f'file{i}.mp4'] for i in range(10)]
+    commands[3].insert(0, '-error')
+    results = pool.execute_many(commands)
+
+    assert [stdout.split(' ', 1)[1] for stdout, _ in results] == [
+        ' '.join(args) + '\n' for args in commands
+    ]
+    assert [stderr for _, stderr in results] == ['Error: failed\n' if i == 3 else '' for i in range(10)]
+
+def test_small_calls_are_split_across_processes(pool):
+    results = pool.execute_many([[f'file{i}.mp4'] for i in range(10)])
+    pids = [_pid(result) for result in results]
+
+    assert len(set(pids)) == 4
+    assert pids == sorted(pids, key=pids.index)
+    assert [pids.count(pid) for pid in dict.fromkeys(pids)] == [3, 3, 3, 1]
+
+def test_large_calls_are_batched(pool, monkeypatch):
+    monkeypatch.setattr(ExifPool, 'BATCH_SIZE', 2)
+    results = pool.execute_many([[f'file{i}.mp4'] for i in range(20)])
+    pids = [_pid(result) for result in results]
+
+    assert [pids[i] == pids[i + 1] for i in range(0, 20, 2)] == [True] * 10
+    assert len(set(pids)) == 4
+
+def test_empty_call(pool):
+    assert pool.execute_many([]) == []
+
+def test_failed_process_is_replaced(pool):
+    before = {_pid(result) for result in pool.execute_many([['a'], ['b'], ['c'], ['d']])}
+
+    with pytest.raises(RuntimeError):
+        pool.execute_many([['a'], ['b'], ['c'], ['-die']])
+
+    after = {_pid(result) for result in pool.execute_many([['a'], ['b'], ['c'], ['d']])}
+    assert len(after) == 4
+    assert len(after - before) == 1
+
+def test_concurrent_callers_get_their_own_results(pool):
+    results = {}
+
+    def run(name):
+        results[name] = pool.execute_many([[f'{name}{i}'] for i in range(50)])
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ('x', 'y', 'z')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, responses in results.items():
+        assert [stdout.split()[1] for stdout, _ in responses] == [f'{name}{i}' for i in range(50)]
+
+def test_shared_pool_is_closed_after_last_user():
+    first = exiftool.acquire_exif_pool()
+    second = exiftool.acquire_exif_pool()
+    assert first is second
+
+    exiftool.release_exif_pool()
+    assert exiftool._pool is first
+    exiftool.release_exif_pool()
+    assert exiftool._pool is None